@@ -0,0 +1,102 @@
+import os
+import logging
+import requests
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+# shared by the raw_*_trier.py report scripts
+BASE_URL = "http://drogcidade.ddns.net:4647/sgfpod1/"
+LOGIN_URL = BASE_URL + "Login.pod"
+
+# Optional persistent chrome profile so the session cookie survives between runs.
+# Off unless trier_profile_dir is set: hosted CI runners start from a fresh VM, so
+# it only helps on a reused machine. Chrome locks the directory, so scripts that
+# share one profile must run one at a time.
+PROFILE_DIR = os.getenv("trier_profile_dir")
+
+# how long Login.pod may take to show either the login form or the app
+SESSION_CHECK_WAIT = 10  # seconds
+
+
+def has_session(driver, timeout=SESSION_CHECK_WAIT):
+    """True when the page shows the side menu rather than the login form, i.e. we are logged in.
+
+    Returns as soon as either one renders, so a missing session costs no extra wait.
+    """
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(EC.any_of(
+            EC.presence_of_element_located((By.ID, "id_cod_usuario")),
+            EC.presence_of_element_located((By.ID, "sideMenuSearch"))
+        ))
+    except TimeoutException:
+        return False
+    return bool(driver.find_elements(By.ID, "sideMenuSearch"))
+
+
+def http_session(username, password):
+    """requests.Session logged into SGF POD through a plain POST of the login form.
+
+    Returns None when the server answers with the login form again (rejected login).
+    """
+    session = requests.Session()
+    resp = session.post(
+        LOGIN_URL,
+        data={"cod_usuario": username, "nom_senha": password, "login": "1"},
+        timeout=30
+    )
+    resp.raise_for_status()
+
+    if resp.url.endswith("Login.pod") and "id_cod_usuario" in resp.text:
+        logging.warning("HTTP login was rejected; the server returned the login form again.")
+        return None
+    return session
+
+
+def http_login(driver, username, password):
+    """POST the login form with requests and hand the session cookies to the driver."""
+    try:
+        session = http_session(username, password)
+    except requests.RequestException as e:
+        logging.warning(f"HTTP login failed: {e}")
+        return False
+    if session is None:
+        return False
+
+    # the driver is on LOGIN_URL, so cookies land on the right host
+    for cookie in session.cookies:
+        driver.add_cookie({"name": cookie.name, "value": cookie.value, "path": cookie.path or "/"})
+
+    driver.get(BASE_URL)
+    return has_session(driver)
+
+
+def login(driver, wait, username, password):
+    """Open SGF POD and log in: reuse a live session, then try HTTP, then the form."""
+    logging.info("Navigate to the target URL and login")
+    driver.get(LOGIN_URL)
+
+    # only a persistent profile can already carry a session cookie
+    if PROFILE_DIR and has_session(driver):
+        logging.info("Reusing existing Trier session.")
+        return
+
+    if http_login(driver, username, password):
+        logging.info("Logged in over HTTP.")
+        return
+
+    logging.info("HTTP login did not stick; falling back to the login form.")
+    driver.get(LOGIN_URL)
+
+    # the cookie hand-off may have worked after all, in which case Login.pod shows the app
+    if has_session(driver):
+        logging.info("Session is already active.")
+        return
+
+    wait.until(EC.presence_of_element_located((By.ID, "id_cod_usuario"))).send_keys(username)
+    wait.until(EC.presence_of_element_located((By.ID, "nom_senha"))).send_keys(password)
+    wait.until(EC.presence_of_element_located((By.NAME, "login"))).click()
+
+    # page load already blocks until readyState is complete; wait for the menu we use next
+    wait.until(EC.presence_of_element_located((By.ID, "sideMenuSearch")))
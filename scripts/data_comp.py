@@ -1,22 +1,34 @@
 import os
 import json
+import functools
 import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import gspread
+from gspread.utils import absolute_range_name, numericise_all
 from google.oauth2.service_account import Credentials
 
 # ================= CONFIG =================
 
 VALUE_TOLERANCE = 0.15      # R$
+WRITE_CHUNK_ROWS = 10000    # rows per Sheets write request
 
 SOURCE_SHEET_ID = os.getenv("sheet_id")
 CREDS_JSON = os.getenv("GSA_CREDENTIALS")
+CREDS_DICT = json.loads(CREDS_JSON) if CREDS_JSON else None
 
 APP_SHEET = "APP"
 APP_TRIER_SHEET = "APP_TRIER"
 OUTPUT_SHEET = "APPXTRIER"
 
+# Arrow-backed strings keep text in contiguous buffers for the .str ops
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "string"
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s"
@@ -24,122 +36,173 @@ logging.basicConfig(
 
 # ================= HELPERS =================
 
-def connect_sheet():
-    creds_dict = json.loads(CREDS_JSON)
+@functools.lru_cache(maxsize=1)
+def authorized_client():
+    if CREDS_DICT is None:
+        raise ValueError("Environment variable 'GSA_CREDENTIALS' not set.")
+
     scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-    client = gspread.authorize(creds)
-    return client.open_by_key(SOURCE_SHEET_ID)
+    creds = Credentials.from_service_account_info(CREDS_DICT, scopes=scopes)
+    return gspread.authorize(creds)
+
+
+@functools.lru_cache(maxsize=1)
+def connect_sheet():
+    return authorized_client().open_by_key(SOURCE_SHEET_ID)
 
 
-def read_worksheet_as_df(sheet, name):
-    ws = sheet.worksheet(name)
-    return pd.DataFrame(ws.get_all_records())
+def read_worksheets_as_dfs(sheet, names):
+    # One batchGet for every worksheet instead of a fetch + get per sheet
+    resp = sheet.values_batch_get([absolute_range_name(name) for name in names])
+    return [
+        values_to_df(value_range.get("values", []))
+        for value_range in resp["valueRanges"]
+    ]
+
+
+def values_to_df(values):
+    # Same shape as ws.get_all_records(): header row + padded, numericised rows
+    if not values:
+        return pd.DataFrame()
+
+    header = values[0]
+    width = len(header)
+    records = [
+        numericise_all((row + [""] * width)[:width])
+        for row in values[1:]
+    ]
+    return pd.DataFrame(records, columns=header)
 
 
 def clear_and_write(sheet, name, df):
     try:
-        ws = sheet.worksheet(name)
-        ws.clear()
-    except gspread.WorksheetNotFound:
-        ws = sheet.add_worksheet(title=name, rows=1000, cols=20)
-
-    ws.update([df.columns.tolist()] + df.fillna("").values.tolist())
+        sheet.batch_clear([absolute_range_name(name)])
+    except gspread.exceptions.APIError as e:
+        # A missing worksheet shows up as 400 "Unable to parse range"; anything else is a real failure
+        if e.response.status_code != 400 or "Unable to parse range" not in str(e):
+            raise
+        sheet.add_worksheet(title=name, rows=1000, cols=20)
+
+    # Header goes with the first chunk; each chunk is converted only when sent
+    for start in range(0, max(len(df), 1), WRITE_CHUNK_ROWS):
+        chunk = df.iloc[start:start + WRITE_CHUNK_ROWS]
+        values = chunk.fillna("").values.tolist()
+        if start == 0:
+            values.insert(0, df.columns.tolist())
+
+        sheet.values_batch_update({
+            "valueInputOption": "RAW",
+            "data": [{
+                "range": absolute_range_name(name, f"A{start + 2 if start else 1}"),
+                "values": values
+            }]
+        })
 
 
-def parse_brl_currency(value):
-    if value is None or value == "":
-        return 0.0
-    if isinstance(value, (int, float)):
-        return float(value)
+def parse_brl_series(s):
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype("float64").fillna(0.0)
 
-    return float(
-        value.replace("R$", "")
-             .replace(" ", "")
-             .replace(".", "")
-             .replace(",", ".")
+    # Numeric cells come back from the sheet as numbers, text as "R$ 1.234,56"
+    is_text = s.str.len().notna()
+    cleaned = (
+        s.where(is_text, "").astype(STRING_DTYPE)
+         .str.replace("R$", "", regex=False)
+         .str.replace("[\\s\u00a0\u202f]+", "", regex=True)  # incl. NBSP, which RE2's \s skips
+         .str.replace(".", "", regex=False)
+         .str.replace(",", ".", regex=False)
     )
+    parsed = pd.to_numeric(cleaned, errors="coerce")
+    numeric = pd.to_numeric(s.where(~is_text), errors="coerce")
+
+    # Blank cells count as 0.0; anything else that fails to parse is a format problem
+    failed = is_text & (cleaned != "") & parsed.isna()
+    if failed.any():
+        logging.warning(
+            f"{int(failed.sum())} non-empty value(s) in '{s.name}' could not be parsed "
+            f"as BRL and were set to 0.0, e.g. {s[failed].iloc[0]!r}"
+        )
+
+    return parsed.where(is_text, numeric).astype("float64").fillna(0.0)
 
 # ================= MAIN LOGIC =================
 
 def reconcile_app_vs_trier(sheet):
-    logging.info("Reading APP...")
-    df_app = read_worksheet_as_df(sheet, APP_SHEET)
+    logging.info("Reading APP and APP_TRIER...")
+    df_app, df_trier = read_worksheets_as_dfs(sheet, [APP_SHEET, APP_TRIER_SHEET])
+
+    return match_app_to_trier(prepare_app(df_app), prepare_trier(df_trier))
 
-    logging.info("Reading APP_TRIER...")
-    df_trier = read_worksheet_as_df(sheet, APP_TRIER_SHEET)
 
-    # Normalize columns
+def prepare_app(df_app):
     df_app.columns = df_app.columns.str.strip()
-    df_trier.columns = df_trier.columns.str.strip()
 
     # Filter valid payments
-    df_app = df_app[df_app["Pagamento"].isin(["Pix", "Cartão"])].copy()
-
-    # Parse APP values
-    df_app["APP_VALOR_NUM"] = df_app["Valor"].apply(parse_brl_currency)
-
-    results = []
-
-    for _, trier_row in df_trier.iterrows():
-        filial = trier_row["Filial"]
-        total_liquido = parse_brl_currency(trier_row["Total Líquido"])
+    df_app = df_app[df_app["Pagamento"].isin(["Pix", "Cartão"])]
 
-        # Value-based candidates only
-        candidates = df_app.copy()
+    # Among equal values the first sheet row wins (merge_asof alone would take the last)
+    return pd.DataFrame({
+        "Criado em (APP)": df_app.get("Criado em"),
+        "APP_VALOR_NUM": parse_brl_series(df_app["Valor"])
+    }).sort_values("APP_VALOR_NUM", kind="stable").drop_duplicates("APP_VALOR_NUM", keep="first")
 
-        if candidates.empty:
-            results.append(build_no_match_row(trier_row))
-            continue
 
-        candidates["VALOR_DIFF_ABS"] = (
-            candidates["APP_VALOR_NUM"] - total_liquido
-        ).abs()
-
-        candidates = candidates[candidates["VALOR_DIFF_ABS"] <= VALUE_TOLERANCE]
-
-        if candidates.empty:
-            results.append(build_no_match_row(trier_row))
-            continue
+def prepare_trier(df_trier):
+    df_trier.columns = df_trier.columns.str.strip()
 
-        # Pick closest value
-        match = candidates.sort_values("VALOR_DIFF_ABS").iloc[0]
+    return df_trier.assign(
+        TRIER_POS=range(len(df_trier)),
+        TRIER_VALOR_NUM=parse_brl_series(df_trier["Total Líquido"])
+    ).sort_values("TRIER_VALOR_NUM")
 
-        status = classify_status(match["VALOR_DIFF_ABS"])
 
-        results.append({
-            "Filial": filial,
-            "Núm. Venda": trier_row["Núm. Venda"],
-            "Cliente": trier_row["Cliente"],
-            "Criado em (APP)": match.get("Criado em", ""),
-            "Hora (Trier)": trier_row["Hora"],
-            "Valor Venda APP": round(match["APP_VALOR_NUM"], 2),
-            "Total Líquido (Trier)": total_liquido,
-            "Status": status
+def match_app_to_trier(app_sorted, trier_sorted):
+    if app_sorted.empty:
+        # Nothing to match against: every Trier row ends up unmatched
+        merged = trier_sorted.assign(**{
+            "Criado em (APP)": np.nan,
+            "APP_VALOR_NUM": np.nan
         })
-
-    return pd.DataFrame(results)
+    else:
+        # Value-based candidates only: nearest APP value within tolerance
+        merged = pd.merge_asof(
+            trier_sorted,
+            app_sorted,
+            left_on="TRIER_VALOR_NUM",
+            right_on="APP_VALOR_NUM",
+            tolerance=VALUE_TOLERANCE,
+            direction="nearest"
+        )
+    merged = merged.sort_values("TRIER_POS", ignore_index=True)
+
+    diff_abs = (merged["APP_VALOR_NUM"] - merged["TRIER_VALOR_NUM"]).abs()
+
+    result = pd.DataFrame({
+        "Filial": merged["Filial"],
+        "Núm. Venda": merged["Núm. Venda"],
+        "Cliente": merged["Cliente"],
+        "Criado em (APP)": merged["Criado em (APP)"],
+        "Hora (Trier)": merged["Hora"],
+        "Valor Venda APP": merged["APP_VALOR_NUM"].round(2),
+        "Total Líquido (Trier)": merged["TRIER_VALOR_NUM"],
+        "Status": classify_status(diff_abs)
+    })
+
+    no_match = merged["APP_VALOR_NUM"].isna()
+    result.loc[no_match, "Status"] = "SEM CORRESPONDÊNCIA"
+
+    return result
 
 
 def classify_status(diff_abs):
-    if diff_abs == 0:
-        return "OK"
-    if diff_abs <= VALUE_TOLERANCE:
-        return "OK (AJUSTE)"
-    return "VALOR DIVERGENTE"
-
-
-def build_no_match_row(trier_row):
-    return {
-        "Filial": trier_row["Filial"],
-        "Núm. Venda": trier_row["Núm. Venda"],
-        "Cliente": trier_row["Cliente"],
-        "Criado em (APP)": "",
-        "Hora (Trier)": trier_row["Hora"],
-        "Valor Venda APP": "",
-        "Total Líquido (Trier)": parse_brl_currency(trier_row["Total Líquido"]),
-        "Status": "SEM CORRESPONDÊNCIA"
-    }
+    return pd.Series(
+        np.select(
+            [diff_abs == 0, diff_abs <= VALUE_TOLERANCE],
+            ["OK", "OK (AJUSTE)"],
+            default="VALOR DIVERGENTE"
+        ),
+        index=diff_abs.index
+    )
 
 # ================= ENTRYPOINT =================
 
@@ -1,6 +1,8 @@
 import os
 import glob
+import functools
 import gspread
+from gspread.utils import absolute_range_name
 import json
 import time
 import logging
@@ -13,6 +15,19 @@ from googleapiclient.errors import HttpError
 # Config logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
+# Google service account credentials, parsed once at import
+CREDS_JSON = os.getenv("GSA_CREDENTIALS")
+CREDS_DICT = json.loads(CREDS_JSON) if CREDS_JSON else None
+
+# Prefer the Rust-based calamine reader; fall back to pandas' default (xlrd/openpyxl)
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+TOTAL_ROW_PATTERN = r'Total Filial:|Total Geral:'
+
 def get_latest_file(extension='xls', directory='.'):
     """Get the most recently modified file with a given extension."""
     files = glob.glob(os.path.join(directory, f'*.{extension}'))
@@ -39,17 +54,18 @@ def process_excel_data(input_file):
     logging.info("Processing Excel file...")
     
     # Read Excel with skiprows=10 as per your working logic
-    df = pd.read_excel(input_file, skiprows=10, header=0)
+    df = pd.read_excel(input_file, skiprows=10, header=0, engine=EXCEL_ENGINE)
     
     # Remove rows containing "Total Filial:" or "Total Geral:" - EXACTLY as in your working code
-    df = df[
-        ~df.astype(str)
-          .apply(lambda row: row.str.contains(
-              r'Total Filial:|Total Geral:',
-              regex=True,
-              na=False
-          ).any(), axis=1)
-    ]
+    # Only text columns can hold the markers, so scan those column-wise
+    total_rows = np.zeros(len(df), dtype=bool)
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        total_rows |= df[col].astype(str).str.contains(
+            TOTAL_ROW_PATTERN,
+            regex=True,
+            na=False
+        ).to_numpy()
+    df = df[~total_rows]
     
     # List ALL columns that exist in the DataFrame (for debugging)
     logging.info(f"Original columns: {list(df.columns)}")
@@ -142,53 +158,49 @@ def process_excel_data(input_file):
 
 def convert_pandas_to_sheets_format(df):
     """Convert pandas DataFrame to a format suitable for Google Sheets."""
+    df = df.copy()
+
+    # Clean .0 from whole numbers, one column at a time
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_float_dtype(s):
+            numbers = s
+        elif pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            # Only cells rendered as "<n>.0" (floats or numeric strings)
+            numbers = pd.to_numeric(s.where(s.astype(str).str.endswith('.0')), errors='coerce')
+        else:
+            continue
+
+        whole = np.isfinite(numbers) & (numbers % 1 == 0)
+        if whole.any():
+            s = s.astype(object)
+            s[whole] = numbers[whole].map(int).tolist()  # Python ints: no int64 wraparound
+            df[col] = s
+
     # Replace NaN with empty strings
     df = df.fillna("")
-    
-    # Process each cell to clean .0 from whole numbers
-    def clean_value(val):
-        if isinstance(val, (int, np.integer)):
-            return val
-        if isinstance(val, (float, np.floating)):
-            if val.is_integer():
-                return int(val)
-            return val
-        if isinstance(val, str):
-            # Remove .0 from end of string numbers
-            if val.endswith('.0'):
-                try:
-                    num = float(val)
-                    if num.is_integer():
-                        return int(num)
-                except:
-                    pass
-        return val
-    
-    # Apply cleaning
-    cleaned_data = []
-    for _, row in df.iterrows():
-        cleaned_row = [clean_value(cell) for cell in row]
-        cleaned_data.append(cleaned_row)
-    
-    return [df.columns.tolist()] + cleaned_data
+
+    return [df.columns.tolist()] + df.values.tolist()
+
+@functools.lru_cache(maxsize=1)
+def authorized_client():
+    """Authorize once and reuse the gspread client for every upload."""
+    scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+    creds = Credentials.from_service_account_info(CREDS_DICT, scopes=scope)
+    return gspread.authorize(creds)
 
 def update_google_sheet(df, sheet_id, worksheet_name="APP_TRIER"):
     """Update Google Sheet with the processed data"""
     logging.info("Checking Google credentials environment variable...")
-    creds_json = os.getenv("GSA_CREDENTIALS")
-    if creds_json is None:
+    if CREDS_DICT is None:
         logging.error("Google credentials not found in environment variables.")
         return
 
-    creds_dict = json.loads(creds_json)
-    scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-    client = gspread.authorize(creds)
-    
-    # Open spreadsheet and worksheet
+    client = authorized_client()
+
+    # Open spreadsheet
     try:
         spreadsheet = client.open_by_key(sheet_id)
-        sheet = spreadsheet.worksheet(worksheet_name)
     except Exception as e:
         logging.error(f"Error accessing spreadsheet: {e}")
         return
@@ -197,11 +209,18 @@ def update_google_sheet(df, sheet_id, worksheet_name="APP_TRIER"):
     logging.info("Preparing data for Google Sheets...")
     rows = convert_pandas_to_sheets_format(df)
 
-    # Clear sheet and update
+    # Clear sheet and update through the spreadsheet-level batch endpoints
     logging.info("Clearing existing data...")
-    sheet.clear()
+    try:
+        spreadsheet.batch_clear([absolute_range_name(worksheet_name)])
+    except Exception as e:
+        logging.error(f"Error accessing worksheet {worksheet_name}: {e}")
+        return
     logging.info(f"Uploading {len(rows)} rows of data...")
-    retry_api_call(lambda: sheet.update(rows, value_input_option='USER_ENTERED'))
+    retry_api_call(lambda: spreadsheet.values_batch_update({
+        "valueInputOption": "USER_ENTERED",
+        "data": [{"range": absolute_range_name(worksheet_name, "A1"), "values": rows}]
+    }))
     logging.info("Google Sheet updated successfully.")
 
 def main():
@@ -221,8 +240,8 @@ def main():
             
             # Display sample data for verification
             logging.info(f"Sample data (first 5 rows):")
-            for i in range(min(5, len(processed_df))):
-                logging.info(f"Row {i}: {dict(zip(processed_df.columns, processed_df.iloc[i]))}")
+            for i, row in enumerate(processed_df.head(5).itertuples(index=False, name=None)):
+                logging.info(f"Row {i}: {dict(zip(processed_df.columns, row))}")
             
             # Optional: Save to local file for debugging
             # processed_df.to_excel("debug_output.xlsx", index=False)
@@ -1,8 +1,8 @@
 import os
 import time
 import logging
-import shutil
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -10,6 +10,9 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import StaleElementReferenceException
+import requests
+from _trier_session import LOGIN_URL, PROFILE_DIR, http_session, login
 
 # set up logging config
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,126 +24,184 @@ password = os.getenv("trier_password")
 if not username or not password:
     raise ValueError("Environment variables 'user' and/or 'password' not set.")
 
-# Calculate date range
-today = datetime.today()
+# Calculate date range in business-local time (the runner clock is UTC)
+today = datetime.now(ZoneInfo("America/Sao_Paulo"))
 report_date = today - timedelta(days=1)
 start_date = report_date - timedelta(days=1) if report_date.weekday() == 6 else report_date
-inicio = f"{start_date.strftime('%d/%m/%Y')}"  
-fim = f"{report_date.strftime('%d/%m/%Y')}"
+inicio = start_date.strftime('%d/%m/%Y')
+fim = report_date.strftime('%d/%m/%Y')
 
 download_dir = os.getcwd()
+REPORT_FILENAME = "relacao_vendas.xls"
+report_filepath = os.path.join(download_dir, REPORT_FILENAME)
+BROWSER_DOWNLOAD_MAX_WAIT_TIME = 120  # seconds
+BLOCKED_ASSET_URLS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico", "*.woff", "*.woff2", "*.ttf"]
+
+tipo_cartao = ["1", "9", "10", "11", "16", "17"]
+CARD_ENTRY_PAUSE = 2  # seconds the form is given to take each card code
+
+# direct report endpoint (the form action runReport posts to); without it only the browser flow runs
+REPORT_URL = os.getenv("trier_report_url")
+USE_SELENIUM = os.getenv("USE_SELENIUM") == "1" or not REPORT_URL
+XLS_SIGNATURE = b"\xd0\xcf\x11\xe0"  # OLE2 compound file header of legacy .xls
+
+
+def download_report_http():
+    """Fetch the report straight from the SGF POD endpoint; False means fall back to Selenium."""
+    logging.info("Requesting report over HTTP...")
+    partial_path = report_filepath + ".part"
+    file_size = 0
+    try:
+        session = http_session(username, password)
+        if session is None:
+            return False
+        # field names mirror the browser form but have not been checked against a captured
+        # request yet; the signature check below keeps a wrong guess from passing as a report
+        report_form = {"cod_cartao": tipo_cartao, "dat_inicio": inicio, "dat_fim": fim, "saida": "4"}
+        with session.post(REPORT_URL, data=report_form, stream=True, timeout=BROWSER_DOWNLOAD_MAX_WAIT_TIME) as resp:
+            resp.raise_for_status()
+            chunks = resp.iter_content(chunk_size=1 << 16)
+            first_chunk = next(chunks, b"")
+            if not first_chunk:
+                logging.warning("Report endpoint returned an empty file.")
+                return False
+
+            # the OLE2 signature is the only acceptance test; headers can claim Excel for an error page
+            if not first_chunk.startswith(XLS_SIGNATURE):
+                logging.warning(
+                    f"Report endpoint did not return an .xls (starts with {first_chunk[:8]!r})."
+                )
+                return False
+
+            with open(partial_path, "wb") as f:
+                f.write(first_chunk)
+                file_size = len(first_chunk)
+                for chunk in chunks:
+                    f.write(chunk)
+                    file_size += len(chunk)
+
+        os.replace(partial_path, report_filepath)
+    except (requests.RequestException, OSError) as e:
+        logging.warning(f"HTTP report download failed: {e}")
+        return False
+    finally:
+        # never leave a half-written download behind
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    logging.info(f"Report saved to {REPORT_FILENAME}. Size: {file_size} bytes")
+    return True
+
+
+if not USE_SELENIUM and download_report_http():
+    raise SystemExit(0)
 
 # set up chrome options for headless mode/configure download behavior
 chrome_options = Options()
-chrome_options.add_argument("--headless")  
+chrome_options.page_load_strategy = 'normal'  # get()/click navigation block until readyState is complete
+chrome_options.add_argument("--headless=new")
 chrome_options.add_argument("--no-sandbox")
 chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--enable-downloads")  # Explicitly enable downloads
-chrome_options.add_argument("--remote-debugging-port=9222")
 chrome_options.add_argument("--disable-popup-blocking")
 chrome_options.add_argument("--disable-dev-shm-usage")
 chrome_options.add_argument("--window-size=1920,1080")  # Set dimensions
-chrome_options.add_argument("--start-maximized")  # Maximize window
-chrome_options.add_argument("--force-device-scale-factor=1")  # Prevent scaling
+chrome_options.add_argument("--disable-extensions")
+chrome_options.add_argument("--disable-background-networking")
+chrome_options.add_argument("--disable-sync")
+chrome_options.add_argument("--disable-default-apps")
+chrome_options.add_argument("--disable-renderer-backgrounding")
+chrome_options.add_argument("--blink-settings=imagesEnabled=false")  # images are never needed
+chrome_options.add_argument("--mute-audio")
+if PROFILE_DIR:
+    chrome_options.add_argument(f"--user-data-dir={PROFILE_DIR}")  # reuse session cookies between runs
 
 prefs = {
     "download.default_directory": download_dir,  # set download path
-    "plugins.always_open_pdf_externally": True, # auto-downloads pdf files instead of opening in new window
-    "download.open_pdf_in_system_reader": False,
-    "pdfjs.disabled": True,  # Disable built-in PDF viewer
     "download.prompt_for_download": False,  # disable prompt
     "directory_upgrade": True,  # auto-overwrite existing files
     "safebrowsing.disable_download_protection": True
 }
 chrome_options.add_experimental_option("prefs", prefs)
-chrome_options.add_argument("--unsafely-treat-insecure-origin-as-secure=http://drogcidade.ddns.net:4647/sgfpod1/Login.pod")
+chrome_options.add_argument(f"--unsafely-treat-insecure-origin-as-secure={LOGIN_URL}")
 
 # initialize webdriver
 driver = webdriver.Chrome(options=chrome_options)
 
+# make headless chrome save downloads straight into download_dir
+driver.execute_cdp_cmd("Browser.setDownloadBehavior", {"behavior": "allow", "downloadPath": download_dir})
+
+# skip images and fonts the scraper never looks at; CSS stays so visibility/clickable checks still hold
+driver.execute_cdp_cmd("Network.enable", {})
+driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_ASSET_URLS})
+
 # start download process 
 try:
-    logging.info("Navigate to the target URL and login")
-    driver.get("http://drogcidade.ddns.net:4647/sgfpod1/Login.pod")
-    
+    # one wait for the whole flow; 100 ms polling picks elements up as soon as they render
+    wait = WebDriverWait(driver, 20, poll_frequency=0.1, ignored_exceptions=(StaleElementReferenceException,))
+
     # Add this at startup
     logging.info(f"Download directory set to: {download_dir}")
     os.makedirs(download_dir, exist_ok=True)
 
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "id_cod_usuario"))).send_keys(username)
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "nom_senha"))).send_keys(password)
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.NAME, "login"))).click()
-
-    # wait til page loads completely
-    WebDriverWait(driver, 10).until(lambda x: x.execute_script("return document.readyState === 'complete'"))
-    time.sleep(5)
+    login(driver, wait, username, password)
 
     driver.find_element(By.TAG_NAME, "body").send_keys(Keys.F11)
-    time.sleep(2)
 
     # access "Relação de Vendas"
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "sideMenuSearch")))
+    wait.until(EC.presence_of_element_located((By.ID, "sideMenuSearch")))
     driver.find_element(By.ID, "sideMenuSearch").send_keys("Relação de Vendas")
     driver.find_element(By.ID, "sideMenuSearch").click()
-    time.sleep(5)
 
-    driver.find_element(By.CSS_SELECTOR, '[title="Relação de Vendas"]').click()
-    time.sleep(10)
+    wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, '[title="Relação de Vendas"]'))).click()
     
-    tipo_cartao = ["1", "9", "10", "11", "16", "17"]
-        
     for codigo in tipo_cartao:
-        input_element = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "cod_cartaoEntrada"))
+        # look the input up again each time; the form may re-render it after an entry
+        input_element = wait.until(
+            EC.element_to_be_clickable((By.ID, "cod_cartaoEntrada"))
         )
-        input_element.send_keys(codigo)
-        input_element.send_keys(Keys.ENTER)
-        time.sleep(2)
+        input_element.send_keys(codigo, Keys.ENTER)
+        # the form shows no reliable sign that a code was accepted, so keep the fixed pause
+        time.sleep(CARD_ENTRY_PAUSE)
         
-    WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.ID, "tabTabdhtmlgoodies_tabView1_1"))).click()
-    time.sleep(2)
+    wait.until(EC.presence_of_element_located((By.ID, "tabTabdhtmlgoodies_tabView1_1"))).click()
     
     # start and end dates
-    driver.find_element(By.ID, "dat_inicio").send_keys(inicio)
-    time.sleep(5)
-    driver.find_element(By.ID, "dat_fim").send_keys(fim)
-    time.sleep(2)
+    wait.until(EC.element_to_be_clickable((By.ID, "dat_inicio"))).send_keys(inicio)
+    wait.until(EC.element_to_be_clickable((By.ID, "dat_fim"))).send_keys(fim)
         
     # report format; downloads pdf file
-    driver.find_element(By.ID, "saida_4").click()
-    time.sleep(2)
+    wait.until(EC.element_to_be_clickable((By.ID, "saida_4"))).click()
           
+    # snapshot the download dir so only files from this run are picked up
+    files_before = {entry.name for entry in os.scandir(download_dir)}
+
     # trigger report download
     logging.info("Triggering report download...")
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "runReport"))).click()
+    wait.until(EC.element_to_be_clickable((By.ID, "runReport"))).click()
 
     # log download start
     logging.info("Download has started.")
-    time.sleep(10)
 
-    # get the most recent downloaded file
-    files = os.listdir(download_dir)
-    downloaded_files = [f for f in files if f.endswith('.xls')]
-    if downloaded_files:
-        downloaded_files.sort(key=lambda x: os.path.getmtime(os.path.join(download_dir, x)))
-        most_recent_file = downloaded_files[-1]
-        downloaded_file_path = os.path.join(download_dir, most_recent_file)
+    # wait for a new .xls with no partial .crdownload left behind
+    downloaded_files = []
+    for _ in range(BROWSER_DOWNLOAD_MAX_WAIT_TIME * 2):
+        new_entries = [entry for entry in os.scandir(download_dir) if entry.name not in files_before]
+        if not any(entry.name.endswith('.crdownload') for entry in new_entries):
+            downloaded_files = [entry for entry in new_entries if entry.name.endswith('.xls')]
+            if downloaded_files:
+                break
+        time.sleep(0.5)
 
-        # rename the file 
-        new_filename = f"relacao_vendas.xls"
-        new_filepath = os.path.join(download_dir, new_filename)
-
-        # make sure not to overwrite existing file
-        if os.path.exists(new_filepath):
-            os.remove(new_filepath)
+    if downloaded_files:
+        downloaded_file = downloaded_files[0]
+        file_size = downloaded_file.stat().st_size
 
-        shutil.move(downloaded_file_path, new_filepath)
+        # rename the file; os.replace atomically overwrites any previous report
+        os.replace(downloaded_file.path, report_filepath)
 
-        file_size = os.path.getsize(new_filepath)
-        logging.info(f"File renamed to {new_filename}. Size: {file_size} bytes")
+        logging.info(f"File renamed to {REPORT_FILENAME}. Size: {file_size} bytes")
     else:
         logging.error("Download failed. No files found.")
-        time.sleep(5)
 
 finally:
     driver.quit()